@@ -0,0 +1,643 @@
+import json
+import math
+import os
+import signal
+from array import array
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from urllib.parse import urlparse
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+
+# -----------------------------
+# Env / Config
+# -----------------------------
+# Same variables as spark_streaming_job.py so either processor can be swapped
+# into the same compose service definition.
+KAFKA_BOOTSTRAP = os.getenv("KAFKA_BOOTSTRAP", "kafka:29092")
+TOPIC = os.getenv("KAFKA_TOPIC", os.getenv("TOPIC", "stream.events"))
+GROUP_ID = os.getenv("KAFKA_GROUP_ID", "stream-lite")
+STARTING_OFFSETS = os.getenv("STARTING_OFFSETS", "latest")
+
+WATERMARK = os.getenv("WATERMARK", "10 minutes")
+WINDOW = os.getenv("WINDOW", "1 minute")
+
+# Micro-batch shape: up to BATCH_SIZE messages, waiting at most BATCH_TIMEOUT seconds
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "5000"))
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT", "1.0"))
+
+# Read events from a JSON-lines file instead of Kafka (one event per line).
+# Useful as a local stand-in for the broker; the process exits at end of file.
+# Positions are stored like Kafka offsets, so rerunning a file only reads new lines.
+REPLAY_FILE = os.getenv("REPLAY_FILE", "")
+
+PG_HOST = os.getenv("PG_HOST", "postgres")
+PG_PORT = int(os.getenv("PG_PORT", "5432"))
+PG_DB = os.getenv("PG_DB", "realtime")
+PG_USER = os.getenv("PG_USER", "rt")
+PG_PASS = os.getenv("PG_PASS", "rt")
+
+PG_URL = os.getenv("PG_URL", "")
+if PG_URL.startswith("jdbc:postgresql://"):
+    raw = PG_URL.replace("jdbc:", "", 1)
+    u = urlparse(raw)
+    if u.hostname:
+        PG_HOST = u.hostname
+    if u.port:
+        PG_PORT = int(u.port)
+    if u.path and len(u.path) > 1:
+        PG_DB = u.path.lstrip("/")
+
+
+METRICS_TABLE = os.getenv("PG_TABLE", "stream_metrics_minute")
+STATE_TABLE = os.getenv("PG_STATE_TABLE", "stream_state")
+OFFSETS_TABLE = os.getenv("PG_OFFSETS_TABLE", "stream_offsets")
+
+
+# -----------------------------
+# Helpers
+# -----------------------------
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROS = timedelta(microseconds=1)
+
+_UNIT_SECONDS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+
+def pg_conn():
+    return psycopg2.connect(
+        host=PG_HOST,
+        port=PG_PORT,
+        dbname=PG_DB,
+        user=PG_USER,
+        password=PG_PASS,
+    )
+
+
+def clamp_nonnegative(x: int) -> int:
+    return 0 if x is None or x < 0 else x
+
+
+def parse_duration_us(text: str) -> int:
+    """
+    Parse Spark-style interval strings ("1 minute", "10 minutes", "30 seconds")
+    into microseconds.
+    """
+    parts = text.strip().lower().split()
+    if len(parts) != 2:
+        raise ValueError(f"Unsupported duration: {text!r}")
+    amount, unit = parts
+    unit = unit.rstrip("s")
+    if unit not in _UNIT_SECONDS:
+        raise ValueError(f"Unsupported duration unit: {text!r}")
+    return int(float(amount) * _UNIT_SECONDS[unit] * 1_000_000)
+
+
+def to_micros(ts: datetime) -> int:
+    return (ts - EPOCH) // MICROS
+
+
+def from_micros(us: int) -> datetime:
+    return EPOCH + timedelta(microseconds=us)
+
+
+def parse_ts(value) -> datetime | None:
+    # Same inputs the Spark job accepts: ISO8601 with offset, Z-suffix tolerated.
+    # Naive timestamps are read as UTC (the Spark session timezone in the container).
+    if not isinstance(value, str):
+        return None
+    text = value[:-1] + "+00:00" if value.endswith("Z") else value
+    try:
+        ts = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts
+
+
+# from_json (PERMISSIVE) nulls the whole row when a field can't be converted
+# to its schema type; the stream_id filter then drops it.
+class _BadRecord(Exception):
+    pass
+
+
+_NON_NUMERIC_DOUBLES = {"NaN": float("nan"), "Infinity": float("inf"),
+                        "+Infinity": float("inf"), "-Infinity": float("-inf")}
+
+
+def _as_string(value) -> str | None:
+    # StringType takes any JSON token as its text: 123 -> "123", {...} -> '{...}'
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _as_double(value) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise _BadRecord
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and value in _NON_NUMERIC_DOUBLES:
+        return _NON_NUMERIC_DOUBLES[value]
+    raise _BadRecord
+
+
+def _as_int(value) -> int | None:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or not -2**31 <= value < 2**31:
+        raise _BadRecord
+    return value
+
+
+def round_usd(x: float) -> float:
+    # Spark's round() is HALF_UP; Python's built-in round() is HALF_EVEN.
+    # NaN/Infinity pass through unchanged, as in Spark.
+    if not math.isfinite(x):
+        return x
+    return float(Decimal(repr(x)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+
+
+def parse_event(payload: bytes | str | None):
+    """
+    Decode one Kafka value into (event_us, stream_id, event_type, donation_value_usd).
+    Returns None for rows the Spark job would filter out.
+    """
+    if payload is None:
+        return None
+    try:
+        e = json.loads(payload)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(e, dict):
+        return None
+
+    try:
+        stream_id = _as_string(e.get("stream_id"))
+        ts_raw = _as_string(e.get("ts"))
+        event_type = _as_string(e.get("event_type"))
+        _as_int(e.get("message_len"))
+        amount_usd = _as_double(e.get("amount_usd"))
+        amount = _as_double(e.get("amount"))
+    except _BadRecord:
+        return None
+
+    if stream_id is None:
+        return None
+
+    ts = parse_ts(ts_raw)
+    if ts is None:
+        return None
+
+    # Donation value: prefer amount_usd; fall back to amount
+    if amount_usd is not None:
+        donation_value_usd = amount_usd
+    elif amount is not None:
+        donation_value_usd = amount
+    else:
+        donation_value_usd = 0.0
+
+    return to_micros(ts), stream_id, event_type, donation_value_usd
+
+
+# -----------------------------
+# Windowed state
+# -----------------------------
+class _Window:
+    """
+    Aggregates for one window, as parallel arrays indexed by a window-local
+    stream slot. Slots only cover streams seen in this window and are freed
+    with it on eviction.
+    """
+
+    __slots__ = ("slots", "stream_ids", "chat", "donations")
+
+    def __init__(self):
+        self.slots: dict[str, int] = {}
+        self.stream_ids: list[str] = []
+        self.chat = array("q")
+        self.donations = array("d")
+
+    def slot(self, stream_id: str) -> int:
+        slot = self.slots.get(stream_id)
+        if slot is None:
+            slot = len(self.stream_ids)
+            self.slots[stream_id] = slot
+            self.stream_ids.append(stream_id)
+            self.chat.append(0)
+            self.donations.append(0.0)
+        return slot
+
+
+class MinuteAggregator:
+    """
+    Tumbling-window aggregation with a watermark, mirroring the Spark job's
+    groupBy(window, stream_id) in "update" output mode.
+
+    Each open window holds two flat arrays over the streams it has seen, so
+    state is bounded by the open windows and is released when they close.
+    Viewer deltas are kept per batch only: they feed the stream_state upsert,
+    not the window rows.
+    """
+
+    def __init__(self, window_us: int, watermark_us: int):
+        self.window_us = window_us
+        self.watermark_us = watermark_us
+
+        self._windows: dict[int, _Window] = {}
+
+        self._max_event_us: int | None = None
+        self._watermark: int | None = None
+
+        self._touched: set[tuple[int, int]] = set()
+        self._viewer_delta: dict[str, int] = {}
+
+    def _window(self, start_us: int) -> _Window:
+        w = self._windows.get(start_us)
+        if w is None:
+            w = _Window()
+            self._windows[start_us] = w
+        return w
+
+    def seed(self, window_start: datetime, stream_id: str, chat_messages: int, donations_usd: float):
+        """Restore an open window from a previously written metrics row."""
+        w = self._window(to_micros(window_start))
+        slot = w.slot(stream_id)
+        w.chat[slot] = chat_messages
+        w.donations[slot] = donations_usd
+
+    def restore_watermark(self, watermark_us: int):
+        """Set the watermark before the first batch, as Spark does from its checkpoint."""
+        self._watermark = watermark_us
+
+    def add(self, event_us: int, stream_id: str, event_type, donation_value_usd: float) -> bool:
+        # Late rows are dropped only once their window has closed
+        # (window end at or behind the watermark), like Spark does
+        start_us = event_us - (event_us % self.window_us)
+        if self._watermark is not None and start_us + self.window_us <= self._watermark:
+            return False
+
+        if self._max_event_us is None or event_us > self._max_event_us:
+            self._max_event_us = event_us
+
+        w = self._window(start_us)
+        slot = w.slot(stream_id)
+
+        if event_type == "chat_message":
+            w.chat[slot] += 1
+        elif event_type == "donation":
+            w.donations[slot] += donation_value_usd
+        elif event_type == "viewer_join":
+            self._viewer_delta[stream_id] = self._viewer_delta.get(stream_id, 0) + 1
+        elif event_type == "viewer_leave":
+            self._viewer_delta[stream_id] = self._viewer_delta.get(stream_id, 0) - 1
+
+        self._touched.add((start_us, slot))
+        return True
+
+    def drain(self):
+        """
+        Return (metrics_rows, delta_by_stream) for the current batch and reset
+        the per-batch bookkeeping.
+
+        metrics_rows: (window_start, window_end, stream_id, chat_messages, donations_usd)
+        for every (window, stream) updated in this batch, with whole-window totals.
+        """
+        rows = []
+        for start_us, slot in sorted(self._touched):
+            w = self._windows[start_us]
+            rows.append((
+                from_micros(start_us),
+                from_micros(start_us + self.window_us),
+                w.stream_ids[slot],
+                int(w.chat[slot]),
+                round_usd(w.donations[slot]),
+            ))
+
+        delta_by_stream = {sid: d for sid, d in self._viewer_delta.items() if d}
+        self._viewer_delta.clear()
+
+        self._touched.clear()
+        return rows, delta_by_stream
+
+    def advance_watermark(self):
+        """
+        Move the watermark to max event time minus the delay and evict closed
+        windows. As in Spark, this takes effect from the next batch on.
+        """
+        if self._max_event_us is None:
+            return
+        wm = self._max_event_us - self.watermark_us
+        if self._watermark is not None and wm <= self._watermark:
+            return
+        self._watermark = wm
+        for start_us in [s for s in self._windows if s + self.window_us <= wm]:
+            del self._windows[start_us]
+
+    @property
+    def open_windows(self) -> int:
+        return len(self._windows)
+
+
+# -----------------------------
+# Sources
+# -----------------------------
+class _ReplayMessage:
+    __slots__ = ("_value", "_topic", "_offset")
+
+    def __init__(self, value: bytes, topic: str, offset: int):
+        self._value = value
+        self._topic = topic
+        self._offset = offset
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return self._offset
+
+
+class ReplaySource:
+    """
+    Minimal stand-in for confluent_kafka.Consumer backed by a JSON-lines file.
+    Implements only the calls the processor makes.
+
+    The file is a single partition of topic "replay:<file name>" whose offsets
+    are line numbers, so replayed batches record their position in
+    OFFSETS_TABLE like Kafka batches do, and a rerun resumes after the last
+    stored line instead of counting the file twice.
+    """
+
+    def __init__(self, path: str, conn):
+        self.topic = f"replay:{os.path.basename(path)}"
+        self._fh = open(path, "rb")
+        self._offset = 0
+
+        # Same as seeking on partition assignment
+        start = load_offsets(conn, self.topic).get(0, 0)
+        while self._offset < start and self._fh.readline():
+            self._offset += 1
+
+    def consume(self, num_messages: int = 1, timeout: float = -1):
+        batch = []
+        while len(batch) < num_messages:
+            line = self._fh.readline()
+            if not line:
+                break
+            offset = self._offset
+            self._offset += 1
+            line = line.strip()
+            if line:
+                batch.append(_ReplayMessage(line, self.topic, offset))
+        return batch
+
+    def commit(self, asynchronous: bool = True):
+        pass
+
+    def close(self):
+        self._fh.close()
+
+
+def kafka_source(conn):
+    # Imported here so REPLAY_FILE runs don't need the Kafka client installed
+    from confluent_kafka import Consumer
+
+    consumer = Consumer({
+        "bootstrap.servers": KAFKA_BOOTSTRAP,
+        "group.id": GROUP_ID,
+        "auto.offset.reset": "earliest" if STARTING_OFFSETS == "earliest" else "latest",
+        # Postgres holds the authoritative positions; Kafka commits only
+        # keep consumer-group lag visible
+        "enable.auto.commit": False,
+    })
+
+    def _on_assign(c, partitions):
+        stored = load_offsets(conn, TOPIC)
+        for p in partitions:
+            if p.partition in stored:
+                p.offset = stored[p.partition]
+        c.assign(partitions)
+
+    consumer.subscribe([TOPIC], on_assign=_on_assign)
+    return consumer
+
+
+# -----------------------------
+# Postgres
+# -----------------------------
+def seed_open_windows(agg: MinuteAggregator, conn):
+    """
+    Restore the watermark and the windows still open behind it, so a restart
+    keeps accumulating on top of what was already written instead of
+    overwriting it with partial counts.
+
+    The watermark is MAX(window_start) minus the delay: no later than the one
+    in effect before the restart, since the newest event is at or after its
+    window start. Every window ending past it is seeded, so any event it
+    accepts lands on complete totals.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT MAX(window_start) FROM {METRICS_TABLE};")
+        latest_start = cur.fetchone()[0]
+        if latest_start is None:
+            return 0
+
+        watermark = latest_start - timedelta(microseconds=agg.watermark_us)
+        cur.execute(
+            f"""
+            SELECT window_start, stream_id, chat_messages, donations_usd
+            FROM {METRICS_TABLE}
+            WHERE window_end > %s;
+            """,
+            (watermark,)
+        )
+        rows = cur.fetchall()
+
+    agg.restore_watermark(to_micros(watermark))
+    for window_start, stream_id, chat_messages, donations_usd in rows:
+        agg.seed(window_start, stream_id, int(chat_messages or 0), float(donations_usd or 0.0))
+    return len(rows)
+
+
+def load_offsets(conn, topic: str) -> dict[int, int]:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT kafka_partition, next_offset
+            FROM {OFFSETS_TABLE}
+            WHERE consumer_group = %s AND topic = %s;
+            """,
+            (GROUP_ID, topic)
+        )
+        stored = {int(p): int(o) for p, o in cur.fetchall()}
+    conn.commit()
+    return stored
+
+
+def batch_offsets(msgs) -> dict[tuple[str, int], int]:
+    """Next offset to read per (topic, partition) after this batch."""
+    offsets = {}
+    for msg in msgs:
+        key = (msg.topic(), msg.partition())
+        offsets[key] = max(offsets.get(key, 0), msg.offset() + 1)
+    return offsets
+
+
+def write_batch(conn, rows, delta_by_stream, offsets=None):
+    # Same statements as the Spark job's foreachBatch: delta-based state,
+    # set semantics for metrics per (window_start, stream_id).
+    # Every stream with a window update gets a state upsert (delta 0 if it had
+    # no viewer events) so its active_viewers comes back via RETURNING.
+    delta_by_stream = dict(delta_by_stream)
+    for r in rows:
+        delta_by_stream.setdefault(r[2], 0)
+
+    with conn.cursor() as cur:
+        active_map = {}
+        for sid, dsum in delta_by_stream.items():
+            cur.execute(
+                f"""
+                INSERT INTO {STATE_TABLE} (stream_id, active_viewers, updated_at)
+                VALUES (%s, GREATEST(%s, 0), NOW())
+                ON CONFLICT (stream_id)
+                DO UPDATE SET
+                  active_viewers = GREATEST({STATE_TABLE}.active_viewers + EXCLUDED.active_viewers, 0),
+                  updated_at = NOW()
+                RETURNING active_viewers;
+                """,
+                (sid, dsum)
+            )
+            active_viewers = cur.fetchone()[0]
+            active_map[sid] = clamp_nonnegative(int(active_viewers or 0))
+
+        metrics_rows = [
+            (window_start, window_end, stream_id, active_map.get(stream_id, 0), chat_messages, donations_usd)
+            for window_start, window_end, stream_id, chat_messages, donations_usd in rows
+        ]
+
+        if metrics_rows:
+            sql = f"""
+                INSERT INTO {METRICS_TABLE}
+                  (window_start, window_end, stream_id, active_viewers, chat_messages, donations_usd)
+                VALUES %s
+                ON CONFLICT (window_start, stream_id)
+                DO UPDATE SET
+                  window_end = EXCLUDED.window_end,
+                  active_viewers = EXCLUDED.active_viewers,
+                  chat_messages = EXCLUDED.chat_messages,
+                  donations_usd = EXCLUDED.donations_usd;
+            """
+            execute_values(cur, sql, metrics_rows, page_size=1000)
+
+        # Same transaction as the aggregates: a redelivered batch is never applied twice
+        for (topic, partition), next_offset in (offsets or {}).items():
+            cur.execute(
+                f"""
+                INSERT INTO {OFFSETS_TABLE} (consumer_group, topic, kafka_partition, next_offset, updated_at)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON CONFLICT (consumer_group, topic, kafka_partition)
+                DO UPDATE SET
+                  next_offset = EXCLUDED.next_offset,
+                  updated_at = NOW();
+                """,
+                (GROUP_ID, topic, partition, next_offset)
+            )
+
+    conn.commit()
+
+
+# -----------------------------
+# Processor loop
+# -----------------------------
+def run(source, conn, agg: MinuteAggregator, stop_when_idle: bool = False):
+    running = True
+
+    def _stop(signum, frame):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    batch_id = 0
+    while running:
+        msgs = source.consume(num_messages=BATCH_SIZE, timeout=BATCH_TIMEOUT)
+        if not msgs:
+            if stop_when_idle:
+                break
+            continue
+
+        consumed = []
+        accepted = 0
+        for msg in msgs:
+            if msg.error() is not None:
+                print(f"Consumer error: {msg.error()}")
+                continue
+            consumed.append(msg)
+            ev = parse_event(msg.value())
+            if ev is not None and agg.add(*ev):
+                accepted += 1
+
+        # Error-only batches (e.g. topic not created yet) have no offsets to
+        # commit; committing would raise _NO_OFFSET
+        if not consumed:
+            continue
+
+        rows, delta_by_stream = agg.drain()
+        offsets = batch_offsets(consumed)
+        if rows or delta_by_stream or offsets:
+            write_batch(conn, rows, delta_by_stream, offsets)
+        source.commit(asynchronous=False)
+        agg.advance_watermark()
+
+        print(
+            f"batch={batch_id} messages={len(msgs)} accepted={accepted} "
+            f"rows={len(rows)} open_windows={agg.open_windows}"
+        )
+        batch_id += 1
+
+
+def main():
+    agg = MinuteAggregator(
+        window_us=parse_duration_us(WINDOW),
+        watermark_us=parse_duration_us(WATERMARK),
+    )
+
+    conn = pg_conn()
+    source = ReplaySource(REPLAY_FILE, conn) if REPLAY_FILE else kafka_source(conn)
+    try:
+        seeded = seed_open_windows(agg, conn)
+        conn.commit()
+        if REPLAY_FILE:
+            print(f"Replaying file={REPLAY_FILE} window={WINDOW} watermark={WATERMARK} seeded_rows={seeded}")
+        else:
+            print(
+                f"Consuming topic={TOPIC} bootstrap={KAFKA_BOOTSTRAP} window={WINDOW} "
+                f"watermark={WATERMARK} seeded_rows={seeded}"
+            )
+        run(source, conn, agg, stop_when_idle=bool(REPLAY_FILE))
+    finally:
+        source.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
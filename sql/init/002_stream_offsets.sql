@@ -0,0 +1,13 @@
+-- sql/init/002_stream_offsets.sql
+-- Kafka positions of the lightweight processor (lite_processor.py).
+-- Written in the same transaction as the metrics, so a restart resumes
+-- exactly after the last batch that reached Postgres.
+
+CREATE TABLE IF NOT EXISTS stream_offsets (
+  consumer_group  TEXT        NOT NULL,
+  topic           TEXT        NOT NULL,
+  kafka_partition INTEGER     NOT NULL,
+  next_offset     BIGINT      NOT NULL,
+  updated_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (consumer_group, topic, kafka_partition)
+);